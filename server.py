@@ -2,13 +2,13 @@ from __future__ import annotations
 
 import json
 import os
-import uuid
-from datetime import datetime, timezone
-from typing import Any, Dict, List
+import time
+from typing import Annotated, Any, Callable, Dict, List, Optional, Union
 
+import msgspec
+import orjson
 from fastapi import FastAPI, Request
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import Response
 
 # ============================================================
 # Config
@@ -25,38 +25,142 @@ V0_8_STANDARD_CATALOG_ID = "https://a2ui.org/specification/v0_8/standard_catalog
 # ============================================================
 # App + CORS
 # ============================================================
+# CORS ヘッダは固定値なので bytes で事前に組み立てておく（リクエスト毎の割り当てなし）
+_CORS_ALLOW_ORIGIN = (b"access-control-allow-origin", b"*")  # 開発用。本番はフロントの origin に絞る
+_CORS_ALLOW_METHODS = (b"access-control-allow-methods", b"*")  # OPTIONS preflight OK
+_CORS_MAX_AGE = (b"access-control-max-age", b"600")
+_CORS_PREFLIGHT_HEADERS = [
+    _CORS_ALLOW_ORIGIN,
+    _CORS_ALLOW_METHODS,
+    (b"access-control-allow-headers", b"*"),  # X-A2A-Extensions 等 OK
+    _CORS_MAX_AGE,
+]
+
+
+class CORSAsgi:
+    """
+    allow_origins/methods/headers がすべて "*" の場合に限定した pure ASGI の CORS ミドルウェア:
+      - OPTIONS は 204 で即応答（preflight）。access-control-request-headers があればそれを許可して返す
+      - それ以外はレスポンスヘッダに access-control-allow-origin: * を追加
+    """
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] == "OPTIONS":
+            headers = _CORS_PREFLIGHT_HEADERS
+            # "*" は Authorization をカバーしないので、要求されたヘッダはそのまま許可して返す
+            for name, value in scope["headers"]:
+                if name == b"access-control-request-headers":
+                    headers = [
+                        _CORS_ALLOW_ORIGIN,
+                        _CORS_ALLOW_METHODS,
+                        (b"access-control-allow-headers", value),
+                        _CORS_MAX_AGE,
+                    ]
+                    break
+            await send({"type": "http.response.start", "status": 204, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), _CORS_ALLOW_ORIGIN]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
 app = FastAPI()
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],          # 開発用。本番はフロントの origin に絞る
-    allow_credentials=False,
-    allow_methods=["*"],          # OPTIONS preflight OK
-    allow_headers=["*"],          # X-A2A-Extensions 等 OK
-)
+app.add_middleware(CORSAsgi)
+
+# ============================================================
+# JSON-RPC request envelope
+# ============================================================
+# id は文字列 / 整数 / null。整数はレスポンスで orjson がそのまま書き戻せる 64bit 範囲に限る
+JsonRpcId = Union[str, Annotated[int, msgspec.Meta(ge=-(2**63), le=2**63 - 1)], None]
+
+
+class JsonRpcRequest(msgspec.Struct):
+    """JSON-RPC 2.0 リクエストの外枠。未知のフィールドは無視する"""
+
+    jsonrpc: Optional[str] = None
+    id: JsonRpcId = None
+    method: Optional[str] = None
+    params: Optional[Dict[str, Any]] = None
+
+
+class JsonRpcIdOnly(msgspec.Struct):
+    """外枠の検証に失敗したとき、エラーレスポンスに id を載せるために id だけ読み直す"""
+
+    id: JsonRpcId = None
+
+
+_JSONRPC_REQUEST_DECODER = msgspec.json.Decoder(JsonRpcRequest)
+_JSONRPC_ID_DECODER = msgspec.json.Decoder(JsonRpcIdOnly)
 
 # ============================================================
 # Utilities
 # ============================================================
-def now_iso() -> str:
-    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+# (epoch 秒, ISO8601 文字列)。同じ秒の間は同じ文字列を使い回す
+_ts_cache = (0, "")
 
 
-def jsonrpc_error(req_id: Any, code: int, message: str, http_status: int = 400) -> JSONResponse:
-    return JSONResponse(
-        status_code=http_status,
-        content={
+def now_iso() -> str:
+    global _ts_cache
+    s = int(time.time())
+    if s != _ts_cache[0]:
+        # datetime を作らず time.gmtime + % で直接組み立てる
+        g = time.gmtime(s)
+        _ts_cache = (
+            s,
+            "%04d-%02d-%02dT%02d:%02d:%02dZ"
+            % (g.tm_year, g.tm_mon, g.tm_mday, g.tm_hour, g.tm_min, g.tm_sec),
+        )
+    return _ts_cache[1]
+
+
+def jsonrpc_error(req_id: Any, code: int, message: str, http_status: int = 400) -> Response:
+    body = orjson.dumps(
+        {
             "jsonrpc": "2.0",
             "id": req_id,
             "error": {"code": code, "message": message},
-        },
+        }
     )
+    return Response(content=body, media_type="application/json", status_code=http_status)
+
+
+def _uuid_str(buf: bytes) -> str:
+    """version/variant ビット設定済みの 16 bytes を UUID の正規形（8-4-4-4-12）にする"""
+    h = buf.hex()
+    return f"{h[0:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:32]}"
+
+
+def uuid4_strs(n: int) -> List[str]:
+    """
+    uuid.uuid4() を n 回呼ぶ代わりに os.urandom を一度だけ呼び、
+    UUID オブジェクトを作らずに v4 UUID 文字列を n 個生成する
+    """
+    buf = bytearray(os.urandom(16 * n))
+    for off in range(0, 16 * n, 16):
+        buf[off + 6] = (buf[off + 6] & 0x0F) | 0x40  # version 4
+        buf[off + 8] = (buf[off + 8] & 0x3F) | 0x80  # variant RFC 4122
+    return [_uuid_str(buf[off : off + 16]) for off in range(0, 16 * n, 16)]
 
 
-def build_task_with_a2ui_messages(a2ui_messages: List[Dict[str, Any]]) -> Dict[str, Any]:
-    task_id = str(uuid.uuid4())
-    context_id = str(uuid.uuid4())
-    message_id = str(uuid.uuid4())
+# 空の artifacts / history は共有の空タプルで表す（orjson は tuple を [] として出力する）
+_EMPTY = ()
+
+
+def build_task_with_a2ui_messages(a2ui_messages: List[Any]) -> Dict[str, Any]:
+    task_id, context_id, message_id = uuid4_strs(3)
 
     return {
         "kind": "task",
@@ -79,92 +183,120 @@ def build_task_with_a2ui_messages(a2ui_messages: List[Dict[str, Any]]) -> Dict[s
                 ],
             },
         },
-        "artifacts": [],
-        "history": [],
+        "artifacts": _EMPTY,
+        "history": _EMPTY,
     }
 
 
 def extract_user_text_or_a2ui_event(params_message: Dict[str, Any]) -> Dict[str, Any]:
     parts = params_message.get("parts") or []
-    result: Dict[str, Any] = {"text": None, "a2ui_event": None, "raw_parts": parts}
+    mime = A2UI_MIME_TYPE
+    text = None
+    a2ui_event = None
 
     for p in parts:
         kind = p.get("kind")
-        if kind == "text" and result["text"] is None:
-            result["text"] = p.get("text")
-        elif kind == "data" and p.get("mimeType") == A2UI_MIME_TYPE and result["a2ui_event"] is None:
-            result["a2ui_event"] = p.get("data")
+        if kind == "text" and text is None:
+            text = p.get("text")
+        elif kind == "data" and a2ui_event is None and p.get("mimeType") == mime:
+            a2ui_event = p.get("data")
+        # 両方見つかったら残りの parts は見ない
+        if text is not None and a2ui_event is not None:
+            break
+
+    return {"text": text, "a2ui_event": a2ui_event}
+
+
+# --- 静的な UI 部品 ---
+# title 以外のコンポーネントと beginRendering はリクエストに依存しないので一度だけ組み立てる
+_SURFACE_ID = "main"
+
+_ROOT_COMPONENT = {
+    "id": "root",
+    "component": {
+        "Column": {
+            "children": {"explicitList": ["title_text", "row_buttons"]}
+        }
+    },
+}
+
+_STATIC_COMPONENTS_TAIL = [
+    {
+        "id": "row_buttons",
+        "component": {
+            "Row": {
+                "alignment": "center",
+                "children": {"explicitList": ["btn_ok", "btn_cancel"]},
+            }
+        },
+    },
+    {
+        "id": "btn_ok_text",
+        "component": {"Text": {"text": {"literalString": "OK"}}},
+    },
+    {
+        "id": "btn_ok",
+        "component": {
+            "Button": {
+                "child": "btn_ok_text",
+                "action": {"name": "clicked_ok"},
+            }
+        },
+    },
+    {
+        "id": "btn_cancel_text",
+        "component": {"Text": {"text": {"literalString": "Cancel"}}},
+    },
+    {
+        "id": "btn_cancel",
+        "component": {
+            "Button": {
+                "child": "btn_cancel_text",
+                "action": {"name": "clicked_cancel"},
+            }
+        },
+    },
+]
+
+_BEGIN_RENDERING = {
+    "beginRendering": {
+        "surfaceId": _SURFACE_ID,
+        "root": "root",
+        "catalogId": V0_8_STANDARD_CATALOG_ID,
+    }
+}
 
-    return result
+# 静的部品は import 時に JSON bytes にしておき、orjson.Fragment としてそのまま埋め込む
+# （リクエスト毎に orjson が再エンコードしない）
+_ROOT_COMPONENT_JSON = orjson.Fragment(orjson.dumps(_ROOT_COMPONENT))
+_STATIC_COMPONENTS_TAIL_JSON = [orjson.Fragment(orjson.dumps(c)) for c in _STATIC_COMPONENTS_TAIL]
+_BEGIN_RENDERING_JSON = orjson.Fragment(orjson.dumps(_BEGIN_RENDERING))
 
 
-def a2ui_messages_v0_8(title: str) -> List[Dict[str, Any]]:
+def a2ui_messages_v0_8(title: str) -> List[Any]:
     """
     v0.8 spec 形式に寄せた最小 UI:
       - surfaceUpdate: components は [{id, component:{...}}] 形式
       - dataModelUpdate: path + contents(キー付きのエントリ配列)
       - beginRendering: root + (optional) catalogId
-    """
-    surface_id = "main"
 
+    静的部品は orjson.Fragment で返すので、orjson でシリアライズすること。
+    """
     # --- Components (Adjacency list + v0.8 "component" wrapper) ---
+    # リクエスト毎に変わるのは title_text だけ
+    title_node = {
+        "id": "title_text",
+        "component": {
+            "Text": {
+                "usageHint": "h3",
+                "text": {"literalString": title},
+            }
+        },
+    }
     surface_update = {
         "surfaceUpdate": {
-            "surfaceId": surface_id,
-            "components": [
-                {
-                    "id": "root",
-                    "component": {
-                        "Column": {
-                            "children": {"explicitList": ["title_text", "row_buttons"]}
-                        }
-                    },
-                },
-                {
-                    "id": "title_text",
-                    "component": {
-                        "Text": {
-                            "usageHint": "h3",
-                            "text": {"literalString": title},
-                        }
-                    },
-                },
-                {
-                    "id": "row_buttons",
-                    "component": {
-                        "Row": {
-                            "alignment": "center",
-                            "children": {"explicitList": ["btn_ok", "btn_cancel"]},
-                        }
-                    },
-                },
-                {
-                    "id": "btn_ok_text",
-                    "component": {"Text": {"text": {"literalString": "OK"}}},
-                },
-                {
-                    "id": "btn_ok",
-                    "component": {
-                        "Button": {
-                            "child": "btn_ok_text",
-                            "action": {"name": "clicked_ok"},
-                        }
-                    },
-                },
-                {
-                    "id": "btn_cancel_text",
-                    "component": {"Text": {"text": {"literalString": "Cancel"}}},
-                },
-                {
-                    "id": "btn_cancel",
-                    "component": {
-                        "Button": {
-                            "child": "btn_cancel_text",
-                            "action": {"name": "clicked_cancel"},
-                        }
-                    },
-                },
-            ],
+            "surfaceId": _SURFACE_ID,
+            "components": [_ROOT_COMPONENT_JSON, title_node, *_STATIC_COMPONENTS_TAIL_JSON],
         }
     }
 
@@ -173,7 +305,7 @@ def a2ui_messages_v0_8(title: str) -> List[Dict[str, Any]]:
     # ルート（"/"）は Map である必要があるため、必ず key/value* 形式で渡す
     data_model_update = {
         "dataModelUpdate": {
-            "surfaceId": surface_id,
+            "surfaceId": _SURFACE_ID,
             "path": "/",  # ルートを更新
             "contents": [
                 {"key": "now", "valueString": now_iso()},
@@ -182,23 +314,44 @@ def a2ui_messages_v0_8(title: str) -> List[Dict[str, Any]]:
     }
 
     # --- Render signal ---
-    begin_rendering = {
-        "beginRendering": {
-            "surfaceId": surface_id,
-            "root": "root",
-            "catalogId": V0_8_STANDARD_CATALOG_ID,
-        }
-    }
+    return [surface_update, data_model_update, _BEGIN_RENDERING_JSON]
+
+
+# ============================================================
+# JSON-RPC methods
+# ============================================================
+def handle_message_send(params: Dict[str, Any]) -> Dict[str, Any]:
+    params_message = params.get("message") or {}
+    parsed = extract_user_text_or_a2ui_event(params_message)
+
+    title = "Hello A2UI (v0.8 spec-compliant)"
+    if parsed["text"]:
+        title = f"You said: {parsed['text']}"
+    elif parsed["a2ui_event"]:
+        # クライアントイベントを受け取った場合（本格的には userAction を解析して分岐）
+        try:
+            event_json = orjson.dumps(parsed["a2ui_event"]).decode()
+        except orjson.JSONEncodeError:
+            # orjson が扱えない入力（64bit を超える整数、深すぎるネスト）は stdlib に任せる（区切りは orjson と揃える）
+            event_json = json.dumps(parsed["a2ui_event"], ensure_ascii=False, separators=(",", ":"))
+        title = f"Got A2UI event: {event_json}"
+
+    a2ui_msgs = a2ui_messages_v0_8(title)
+    return build_task_with_a2ui_messages(a2ui_msgs)
+
 
-    return [surface_update, data_model_update, begin_rendering]
+# method 名 -> handler(params) -> result。メソッドを増やすときはここに登録する
+JSONRPC_METHODS: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    "message/send": handle_message_send,
+}
 
 
 # ============================================================
 # Routes
 # ============================================================
-@app.get("/.well-known/agent-card.json")
-def agent_card() -> Dict[str, Any]:
-    return {
+# PUBLIC_BASE_URL は起動時に確定するので、agent card は import 時に一度だけシリアライズしておく
+_AGENT_CARD_BYTES = orjson.dumps(
+    {
         "protocolVersion": "0.3.0",
         "name": "A2UI Python Agent (Stub)",
         "description": "Minimal A2A JSON-RPC agent that returns A2UI v0.8 messages.",
@@ -209,44 +362,63 @@ def agent_card() -> Dict[str, Any]:
         "defaultOutputModes": ["text"],
         "skills": [{"id": "a2ui", "name": "A2UI", "tags": ["a2ui"]}],
     }
+)
+
 
+@app.get("/.well-known/agent-card.json", response_class=Response)
+def agent_card() -> Response:
+    return Response(_AGENT_CARD_BYTES, media_type="application/json")
 
-@app.post(JSONRPC_PATH)
-async def jsonrpc_handler(request: Request) -> JSONResponse:
+
+@app.post(JSONRPC_PATH, response_class=Response)
+async def jsonrpc_handler(request: Request) -> Response:
+    # パースと型チェックを msgspec で一度に行う（中間の dict を作らない）
+    raw = await request.body()
     try:
-        body = await request.json()
-    except Exception:
+        req = _JSONRPC_REQUEST_DECODER.decode(raw)
+    except msgspec.ValidationError as e:
+        # id 自体が読めれば返す。読めない（型/範囲外）ときだけ null にする
+        try:
+            req_id = _JSONRPC_ID_DECODER.decode(raw).id
+        except (msgspec.DecodeError, RecursionError):
+            req_id = None
+        return jsonrpc_error(req_id, -32600, f"Invalid Request: {e}", http_status=400)
+    except (msgspec.DecodeError, RecursionError):
+        # msgspec はネストが深すぎると RecursionError を送出する
         return jsonrpc_error(None, -32700, "Parse error: invalid JSON", http_status=400)
 
-    req_id = body.get("id")
-    if body.get("jsonrpc") != "2.0":
+    req_id = req.id
+    if req.jsonrpc != "2.0":
         return jsonrpc_error(req_id, -32600, "Invalid Request: jsonrpc must be '2.0'", http_status=400)
 
-    method = body.get("method")
-    params = body.get("params") or {}
+    method = req.method
+    params = req.params or {}
 
-    if method != "message/send":
+    handler = JSONRPC_METHODS.get(method)
+    if handler is None:
         return jsonrpc_error(req_id, -32601, f"Method not found: {method}", http_status=404)
 
-    params_message = params.get("message") or {}
-    parsed = extract_user_text_or_a2ui_event(params_message)
+    result = handler(params)
 
-    title = "Hello A2UI (v0.8 spec-compliant)"
-    if parsed["text"]:
-        title = f"You said: {parsed['text']}"
-    elif parsed["a2ui_event"]:
-        # クライアントイベントを受け取った場合（本格的には userAction を解析して分岐）
-        title = f"Got A2UI event: {json.dumps(parsed['a2ui_event'], ensure_ascii=False)}"
+    # FastAPI の jsonable_encoder を経由させず、シリアライズ済み bytes をそのまま返す
+    # （bytes を渡せば Starlette が Content-Length を付けるので chunked 転送にはならない）
+    body = orjson.dumps({"jsonrpc": "2.0", "id": req_id, "result": result})
+    return Response(content=body, media_type="application/json", status_code=200)
 
-    a2ui_msgs = a2ui_messages_v0_8(title)
-    task = build_task_with_a2ui_messages(a2ui_msgs)
 
-    return JSONResponse(
-        status_code=200,
-        content={"jsonrpc": "2.0", "id": req_id, "result": task},
-    )
+# healthz で変わるのは time だけなので、前後の bytes を事前に作って挟み込む
+_HEALTHZ_PREFIX = b'{"ok":true,"time":"'
+_HEALTHZ_SUFFIX = b'","publicBaseUrl":' + orjson.dumps(PUBLIC_BASE_URL) + b"}"
+
+
+@app.get("/healthz", response_class=Response)
+def healthz() -> Response:
+    body = b"".join((_HEALTHZ_PREFIX, now_iso().encode(), _HEALTHZ_SUFFIX))
+    return Response(body, media_type="application/json")
+
 
+if __name__ == "__main__":
+    import uvicorn
 
-@app.get("/healthz")
-def healthz() -> Dict[str, Any]:
-    return {"ok": True, "time": now_iso(), "publicBaseUrl": PUBLIC_BASE_URL}
+    # uvloop (イベントループ) + httptools (HTTP パーサ) でリクエスト毎のオーバーヘッドを下げる
+    uvicorn.run(app, host="0.0.0.0", port=PORT, loop="uvloop", http="httptools")
@@ -0,0 +1,83 @@
+from fastapi.testclient import TestClient
+
+from server import JSONRPC_PATH, app
+
+client = TestClient(app)
+
+
+def post_jsonrpc(body: bytes):
+    return client.post(JSONRPC_PATH, content=body, headers={"Content-Type": "application/json"})
+
+
+def test_large_int_id_is_rejected_not_500():
+    r = post_jsonrpc(b'{"jsonrpc":"2.0","id":1180591620717411303424,"method":"message/send"}')
+    assert r.status_code == 400
+    assert r.json()["error"]["code"] == -32600
+    assert r.json()["id"] is None
+
+
+def test_int64_id_is_echoed():
+    r = post_jsonrpc(b'{"jsonrpc":"2.0","id":9223372036854775807,"method":"message/send"}')
+    assert r.status_code == 200
+    assert r.text.startswith('{"jsonrpc":"2.0","id":9223372036854775807,')
+
+
+def test_invalid_request_echoes_valid_id():
+    r = post_jsonrpc(b'{"jsonrpc":"2.0","id":5,"method":123}')
+    assert r.status_code == 400
+    assert r.json()["id"] == 5
+    assert r.json()["error"]["code"] == -32600
+
+
+def test_too_deeply_nested_params_is_invalid_request():
+    depth = 1000
+    r = post_jsonrpc(b'{"jsonrpc":"2.0","id":1,"method":"message/send","params":' + b"[" * depth + b"]" * depth + b"}")
+    assert r.status_code == 400
+    assert r.json()["id"] is None
+    assert r.json()["error"]["code"] == -32600
+
+
+def a2ui_event_request(event_json: bytes) -> bytes:
+    return (
+        b'{"jsonrpc":"2.0","id":1,"method":"message/send","params":{"message":{"parts":'
+        b'[{"kind":"data","mimeType":"application/json+a2ui","data":' + event_json + b"}]}}}"
+    )
+
+
+def echoed_title(r) -> str:
+    parts = r.json()["result"]["status"]["message"]["parts"]
+    return parts[0]["data"]["surfaceUpdate"]["components"][1]["component"]["Text"]["text"]["literalString"]
+
+
+def test_a2ui_event_with_large_int_is_echoed():
+    r = post_jsonrpc(a2ui_event_request(b'{"n":1180591620717411303424}'))
+    assert r.status_code == 200
+    assert echoed_title(r) == 'Got A2UI event: {"n":1180591620717411303424}'
+
+
+def test_deeply_nested_a2ui_event_is_echoed():
+    depth = 300
+    r = post_jsonrpc(a2ui_event_request(b"[" * depth + b"]" * depth))
+    assert r.status_code == 200
+    assert echoed_title(r).startswith("Got A2UI event: [[[")
+
+
+def test_preflight_echoes_requested_headers():
+    r = client.options(
+        JSONRPC_PATH,
+        headers={
+            "Origin": "http://example.com",
+            "Access-Control-Request-Method": "POST",
+            "Access-Control-Request-Headers": "authorization,content-type",
+        },
+    )
+    assert r.status_code == 204
+    assert r.headers["access-control-allow-origin"] == "*"
+    assert r.headers["access-control-allow-headers"] == "authorization,content-type"
+
+
+def test_too_deeply_nested_a2ui_event_is_parse_error():
+    for depth in (1000, 5000, 100000):
+        r = post_jsonrpc(a2ui_event_request(b"[" * depth + b"]" * depth))
+        assert r.status_code == 400
+        assert r.json()["error"]["code"] == -32700